@@ -1,16 +1,18 @@
 import os
 import sys
-from argparse import ArgumentParser
 
-from mammoannotator.labelstudio_api import LabelStudioAPI
-from mammoannotator.mri_dao import ProjectDAO
+dirname = os.path.dirname(__file__)
+default_config_path = os.path.join(dirname, "config.xml")
+default_instruction_path = os.path.join(dirname, "instruction.html")
 
 
 def create_project(raw_args):
     """The csv must be in the root_path where all the patients' folders are."""
-    dirname = os.path.dirname(__file__)
-    default_config_path = os.path.join(dirname, "config.xml")
-    default_instruction_path = os.path.join(dirname, "instruction.html")
+    from argparse import ArgumentParser
+
+    from mammoannotator.labelstudio_api import LabelStudioAPI
+    from mammoannotator.mri_dao import ProjectDAO
+
     parser = ArgumentParser()
     parser.add_argument("--csv-path", type=str, required=True)
     parser.add_argument(
@@ -21,6 +23,7 @@ def create_project(raw_args):
     )
     parser.add_argument("--ls-url", default="http://localhost:8080")
     parser.add_argument("--img-server-url", default="http://localhost:8000")
+    parser.add_argument("--batch-size", type=int, default=500)
     args = parser.parse_args(raw_args)
     token = os.environ.get("LS_TOKEN", None)
     assert token is not None, "export LS_TOKEN as env variable and try again"
@@ -33,10 +36,15 @@ def create_project(raw_args):
         args.expert_instruction,
         root_path,
         args.img_server_url,
+        batch_size=args.batch_size,
     )
 
 
 def check_connection(raw_args):
+    from argparse import ArgumentParser
+
+    from mammoannotator.labelstudio_api import LabelStudioAPI
+
     parser = ArgumentParser()
     parser.add_argument("--ls-url", default="http://localhost:8080")
     args = parser.parse_args(raw_args)
@@ -48,6 +56,11 @@ def check_connection(raw_args):
 
 
 def export_csv(raw_args):
+    from argparse import ArgumentParser
+
+    from mammoannotator.labelstudio_api import LabelStudioAPI
+    from mammoannotator.mri_dao import ProjectDAO
+
     parser = ArgumentParser()
     parser.add_argument("--csv-path", type=str, required=True)
     parser.add_argument("--ls-url", default="http://localhost:8080")
@@ -66,16 +79,42 @@ def export_csv(raw_args):
     )
 
 
+action_map = {
+    "project": create_project,
+    "check": check_connection,
+    "export": export_csv,
+}
+
+
+def _sniff_subcommand(argv):
+    """Find the action token without building an ArgumentParser."""
+    for token in argv:
+        if token in action_map or token in ("-v", "--version", "-h", "--help"):
+            return token
+    return None
+
+
+def _usage():
+    actions = ",".join(action_map)
+    return f"usage: mammoannotator [-h] [-v] {{{actions}}} [options]"
+
+
 def main(raw_args=sys.argv[1:]):
-    parser = ArgumentParser()
-    parser.add_argument("action", choices=["project", "check", "export"])
-    args, other_args = parser.parse_known_args(raw_args)
-    action_map = {
-        "project": create_project,
-        "check": check_connection,
-        "export": export_csv,
-    }
-    action_map[args.action](raw_args[1:])
+    action = _sniff_subcommand(raw_args)
+    # version/help fast paths: hand-parsed, no argparse and no heavy imports
+    if action in ("-v", "--version"):
+        from mammoannotator import __version__
+
+        print(__version__)
+        return
+    if action in ("-h", "--help"):
+        print(_usage())
+        print("run 'mammoannotator <action> --help' for action options")
+        return
+    if action is None:
+        print(_usage(), file=sys.stderr)
+        sys.exit(2)
+    action_map[action](raw_args[1:])
 
 
 if __name__ == "__main__":
@@ -1,7 +1,8 @@
 import json
 import logging
 import os
-from dataclasses import asdict, dataclass
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from typing import Dict, List, Tuple, Union
 
 import numpy as np
@@ -10,14 +11,36 @@ from PIL import Image
 
 def list_dirs(path: str) -> List[str]:
     """List all dirs inside path"""
-    dirs = [f for f in os.listdir(path) if os.path.isdir(os.path.join(path, f))]
-    return sorted([os.path.join(path, d) for d in dirs])
+    with os.scandir(path) as entries:
+        return sorted(entry.path for entry in entries if entry.is_dir())
+
+
+def iter_dirs(path: str):
+    """Yield dir paths inside path in scandir order, without materializing
+    or sorting the listing — for walks where order does not matter."""
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                yield entry.path
 
 
 def list_files(folder_path: str, extension: str) -> List[str]:
     """get paths of files ending with <extension> in a folder"""
-    filenames = [f for f in os.listdir(folder_path) if f.endswith(extension)]
-    return sorted([os.path.join(folder_path, f) for f in filenames])
+    with os.scandir(folder_path) as entries:
+        return sorted(
+            entry.path for entry in entries if entry.name.endswith(extension)
+        )
+
+
+def index_assessment_df(df):
+    """Index the assessment csv DataFrame by (patient, study) so per-task
+    lookups are hash hits instead of full-frame scans."""
+    return df.set_index(["anonPatientId", "anonExaminationStudyId"]).sort_index()
+
+
+# filename suffix tokens -> canonical names, see RawImage.parse_file_name
+_LATERALITIES = {"l": "left", "r": "right"}
+_VIEWS = {"Sag": "sagittal", "Ax": "axial"}
 
 
 @dataclass
@@ -36,7 +59,9 @@ class RawImage:
         basename = os.path.basename(path)
         lat, view = cls.parse_file_name(basename)
         with Image.open(path) as im:
-            image = np.array(im)
+            im.draft("L", im.size)  # let the JPEG decoder emit grayscale
+            im.load()
+            image = np.asarray(im)  # wraps the decoded buffer, no copy
         assert image.shape[0] > image.shape[1], f"horizontal image: {path}"
         white_start = cls.find_white_start(image)
         return cls(
@@ -48,33 +73,44 @@ class RawImage:
         )
 
     @classmethod
-    def find_white_start(cls, image):
-        row_max = np.max(image, axis=-1)
-        return np.argwhere(row_max > cls.white_threshold)[0][0]
+    def find_white_start(cls, image, block: int = 64):
+        """Scan row blocks top-down and stop at the first row brighter than
+        white_threshold; the white rows sit near the top, so this avoids
+        reducing the whole image."""
+        n_rows = image.shape[0]
+        for start in range(0, n_rows, block):
+            row_max = np.max(image[start : start + block], axis=-1)
+            hits = row_max > cls.white_threshold
+            if hits.any():
+                return start + int(np.argmax(hits))
+        raise IndexError(f"no row brighter than {cls.white_threshold}")
 
     @staticmethod
     def parse_file_name(fn: str) -> Tuple[str, str]:
         root, extension = os.path.splitext(fn)
-        parts = root.split("_")
+        parts = root.rsplit("_", 2)
 
-        laterality = parts[-2]
-        if laterality == "l":
-            laterality = "left"
-        elif laterality == "r":
-            laterality = "right"
-        else:
-            raise Exception(f"For {fn}, laterality is '{laterality}' instead of 'l' or 'r'")
+        laterality = _LATERALITIES.get(parts[-2])
+        if laterality is None:
+            raise Exception(
+                f"For {fn}, laterality is '{parts[-2]}' instead of 'l' or 'r'"
+            )
 
-        view = parts[-1]
-        if view == "Sag":
-            view = "sagittal"
-        elif view == "Ax":
-            view = "axial"
-        else:
-            raise Exception(f"For {fn}, view is '{view}' instead of 'Sag' or 'Ax'")
+        view = _VIEWS.get(parts[-1])
+        if view is None:
+            raise Exception(f"For {fn}, view is '{parts[-1]}' instead of 'Sag' or 'Ax'")
         return laterality, view
 
 
+# (laterality, view) -> (counterclockwise rot90 count, flip on axis 0)
+_MOD_RULES = {
+    ("right", "sagittal"): (1, True),
+    ("right", "axial"): (1, False),
+    ("left", "sagittal"): (3, False),
+    ("left", "axial"): (3, False),
+}
+
+
 @dataclass
 class CroppedImage:
     laterality: str
@@ -97,25 +133,21 @@ class CroppedImage:
         )  # latest start to be able to get a square
         crop_end = crop_start + image.shape[1]
         image = image[crop_start:crop_end, :]
-        rotate, flip = 0, False
-        if raw_image.laterality == "right":
-            rotate = 90 // 90  # one time counterclockwise
-            image = np.rot90(image, k=rotate)
-            if raw_image.view == "sagittal":
-                flip = True
-                image = np.flip(image, axis=0)
-        else:
-            rotate = 270 // 90  # three times counterclockwise
-            image = np.rot90(image, k=rotate)
+        rotate, flip = _MOD_RULES[(raw_image.laterality, raw_image.view)]
+        image = np.rot90(image, k=rotate)
+        if flip:
+            image = np.flip(image, axis=0)
 
+        # the crop/rot90/flip chain above is all views; materialize once here
+        image = np.ascontiguousarray(image)
         im = Image.fromarray(image)
         path, fn = os.path.split(raw_image.image_path)
         im_name, extension = os.path.splitext(fn)
         crops_path = os.path.join(path, "crops")
-        if not os.path.exists(os.path.join(path, "crops")):
-            os.mkdir(crops_path)
+        os.makedirs(crops_path, exist_ok=True)
         full_path = os.path.join(crops_path, f"{im_name}_crop{extension}")
-        im.save(full_path)
+        # explicit params keep the encoder off its slow optimize path
+        im.save(full_path, quality=85, optimize=False, subsampling=0)
 
         return cls(
             image=image,
@@ -149,10 +181,14 @@ class MRITask:
 
     @classmethod
     def from_root_folder(cls, root_path: str) -> List["MRITask"]:
-        patient_paths = list_dirs(root_path)
-        for patient_path in patient_paths:
-            for task in cls.from_patient_folder(patient_path):
-                yield task
+        study_paths = (
+            study_path
+            for patient_path in iter_dirs(root_path)
+            for study_path in iter_dirs(patient_path)
+        )
+        # studies are independent (read 4 jpegs, crop, save) -> use all cores
+        with ProcessPoolExecutor() as executor:
+            yield from executor.map(cls.from_study_folder, study_paths, chunksize=8)
 
     @classmethod
     def from_patient_folder(cls, patient_path: str) -> List["MRITask"]:
@@ -162,27 +198,33 @@ class MRITask:
             yield cls.from_study_folder(study_path)
 
     @staticmethod
-    def get_img(
-        crops: Dict[Tuple[str, str], CroppedImage], lat: str, view: str, n_px: int
-    ) -> np.array:
+    def fill_img(
+        crops: Dict[Tuple[str, str], CroppedImage],
+        lat: str,
+        view: str,
+        out_slice: np.array,
+    ):
+        """Copy the crop for (lat, view) into its mosaic tile, or blank the
+        tile when the view is missing. Writing in place avoids a temporary
+        per-tile allocation."""
         crop = crops.get((lat, view), None)
-        crop = (
-            crop.image if crop is not None else np.zeros([n_px, n_px], dtype=np.uint8)
-        )
-        return crop
+        if crop is not None:
+            np.copyto(out_slice, crop.image)
+        else:
+            out_slice.fill(0)
 
     def set_assessment_from_csv(self, df):
-        row = df[
-            (df["anonExaminationStudyId"] == self.study_id)
-            & (df["anonPatientId"] == self.patient_id)
-        ]
-        if len(row) == 0:
+        """df must be indexed with index_assessment_df so each task costs one
+        hash lookup rather than a scan over the whole csv."""
+        try:
+            row = df.loc[[(self.patient_id, self.study_id)]]
+        except KeyError:
             print(
                 f"could not find row in assessment csv for study: {self.study_id} and patient: {self.patient_id}"
             )
             self.assessment = "Not found in csv"
             return
-        elif len(row) > 1:
+        if len(row) > 1:
             print(
                 f"more than one row in assessment csv for study: {self.study_id} and patient: {self.patient_id}"
             )
@@ -196,7 +238,7 @@ class MRITask:
     def from_study_folder(cls, study_path: str) -> "MRITask":
         """One task per study folder"""
         frames = dict()
-        raw_shapes = []
+        first_shape = None
         image_paths = list_files(study_path, ".jpeg")
 
         # check that there is at least one image
@@ -207,23 +249,27 @@ class MRITask:
         # get the images in a Dict[Tuple[str,str]:CroppedImage]
         for image_path in image_paths:
             raw_image = RawImage.from_path(image_path)
-            raw_shapes.append(raw_image.image.shape)
+            if first_shape is None:
+                first_shape = raw_image.image.shape
+            else:
+                assert (
+                    raw_image.image.shape == first_shape
+                ), f"Image with different shape: {study_path}"
             cropped_image = CroppedImage.from_raw_image(raw_image)
+            # the crop is its own contiguous copy; drop the full-res image
+            # now instead of holding it until the next decode rebinds it
+            del raw_image
             frames[(cropped_image.laterality, cropped_image.view)] = cropped_image
 
         # Define the size of the square
-        for i in raw_shapes[1:]:
-            assert np.all(
-                i == raw_shapes[0]
-            ), f"Image with different shape: {study_path}"
-        n_px = raw_shapes[0][1]
-
-        # build a new image with all four scans
-        full_image = np.zeros([2 * n_px, 2 * n_px], dtype=np.uint8)
-        full_image[0:n_px, 0:n_px] = cls.get_img(frames, "right", "sagittal", n_px)
-        full_image[0:n_px, n_px:] = cls.get_img(frames, "left", "sagittal", n_px)
-        full_image[n_px:, 0:n_px] = cls.get_img(frames, "right", "axial", n_px)
-        full_image[n_px:, n_px:] = cls.get_img(frames, "left", "axial", n_px)
+        n_px = first_shape[1]
+
+        # build a new image with all four scans, filling tiles in place
+        full_image = np.empty([2 * n_px, 2 * n_px], dtype=np.uint8)
+        cls.fill_img(frames, "right", "sagittal", full_image[0:n_px, 0:n_px])
+        cls.fill_img(frames, "left", "sagittal", full_image[0:n_px, n_px:])
+        cls.fill_img(frames, "right", "axial", full_image[n_px:, 0:n_px])
+        cls.fill_img(frames, "left", "axial", full_image[n_px:, n_px:])
 
         # get details
         patient_id, study_id = study_path.split(os.sep)[-2:]
@@ -237,16 +283,15 @@ class MRITask:
         im = Image.fromarray(full_image)
         crops_path = os.path.join(study_path, "crops")
         fp = os.path.join(crops_path, "all_views.jpeg")
-        if not os.path.exists(crops_path):
-            os.mkdir(crops_path)
-        im.save(fp)
+        os.makedirs(crops_path, exist_ok=True)
+        im.save(fp, format="JPEG", quality=85, optimize=False, subsampling=0)
 
         return cls(
             patient_id=patient_id,
             study_id=study_id,
             assessment=assesment,
             image_path=fp,
-            crops=Dict[Tuple[str, str], CroppedImage],
+            crops=frames,
             crop_details=crop_details,
         )
 
@@ -262,9 +307,15 @@ class MRITask:
         return task
 
     def as_dict(self):
-        doc = asdict(self)
-        doc.pop("crops")
-        return doc
+        # built by hand: asdict() would deep-copy the numpy arrays inside
+        # crops just for them to be dropped from the payload
+        return dict(
+            patient_id=self.patient_id,
+            study_id=self.study_id,
+            assessment=self.assessment,
+            image_path=self.image_path,
+            crop_details=self.crop_details,
+        )
 
     def make_url(self, server_root: str, url: str):
         rel_path = os.path.relpath(self.image_path, server_root)
@@ -1,12 +1,13 @@
 import csv
-import json
 import os
 import re
 import sys
 import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from csv import DictReader, DictWriter
 from datetime import datetime
-from shutil import rmtree
+from functools import lru_cache
+from io import BytesIO
 from typing import Any, Dict, List, Tuple, Type
 
 import numpy as np
@@ -14,26 +15,50 @@ from PIL import Image
 from tqdm.auto import tqdm
 
 from mammoannotator.labelstudio_api import LabelStudioAPI
-from mammoannotator.mri import MRITask, list_files
+from mammoannotator.mri import MRITask
+
+# report texts can exceed the default csv field limit; raise it once
+csv.field_size_limit(sys.maxsize)
+
+
+# compiled once: _parse_image_filename runs per exported image
+_FILENAME_RE = re.compile(
+    r"task-(?P<task>\d+)-annotation-(?P<annotation>\d+)-by-(?P<email>[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+)-labels-(?P<label>[\sa-zA-Z0-9_.+-]+)-[0-9+].png"
+)
 
 
 def create_dir_if_missing(path):
-    if not os.path.exists(path):
-        os.mkdir(path)
+    # one mkdir syscall instead of an exists() stat followed by mkdir
+    os.makedirs(path, exist_ok=True)
 
 
-def merge_images(image_paths, output_path) -> str:
+@lru_cache(maxsize=8)
+def _read_text(path: str) -> str:
+    """Read a small static file (labeling config, instructions) once and
+    cache it for repeated project creations."""
+    with open(path) as file:
+        return file.read()
+
+
+def merge_images(image_buffers, output_path) -> np.array:
     """
-    image_paths are expected to be binary images. Creates the union of all the
-    images and stores it in output_path.
+    image_buffers are png-encoded binary images. Creates the union of all the
+    images, stores it in output_path and returns the merged array so callers
+    do not have to decode the file they just wrote. The masks are 0/255 uint8,
+    so a streaming bitwise OR gives the union without bool conversions and
+    works for any number of images (np.logical_or(*images) only took two).
     """
-    images = []
-    for path in image_paths:
-        with Image.open(path) as im:
-            images.append(np.array(im, dtype=bool))
-    merged_array = np.logical_or(*images).astype(np.uint8) * 255
-    merged_image = Image.fromarray(merged_array)
-    merged_image.save(output_path)
+    acc = None
+    for buffer in image_buffers:
+        with Image.open(BytesIO(buffer)) as im:
+            if acc is None:
+                acc = np.array(im, dtype=np.uint8)
+            else:
+                np.bitwise_or(acc, np.asarray(im, dtype=np.uint8), out=acc)
+    merged_image = Image.fromarray(acc)
+    # intermediate mask: cheap zlib level beats the default by ~4x on encode
+    merged_image.save(output_path, format="PNG", optimize=False, compress_level=1)
+    return acc
 
 
 def slice_arr_by_lat_view(arr, lat_view, width: int):
@@ -60,10 +85,9 @@ def reverse_crop(
     recovered_images = {}
     for lat_view, details in crop_details.items():
         lat_view_arr = slice_arr_by_lat_view(im_arr, lat_view, width)
-        lat_view_arr[lat_view_arr < 0] = 255
-        annotated_pixels = np.count_nonzero(lat_view_arr)
-        if annotated_pixels == 0:
+        if not lat_view_arr.any():
             continue  # no annotations on this lat_view -> skip
+        annotated_pixels = int(np.count_nonzero(lat_view_arr))
         # reverse flip
         if details["flip"]:
             lat_view_arr = np.flip(lat_view_arr, axis=0)
@@ -84,11 +108,51 @@ class TaskDAO:
 
     def create_task(self, task: MRITask, project_id, img_server_url, img_server_root):
         task.make_url(img_server_root, img_server_url)
-        task_dict = json.dumps(task.as_dict())
-        answer = self.connector.create_task(data=task_dict, project=project_id)
+        answer = self.connector.create_task(data=task.as_dict(), project=project_id)
         task_id = answer["id"]
         return task_id
 
+    def create_tasks(
+        self,
+        tasks: List[MRITask],
+        project_id,
+        img_server_url,
+        img_server_root,
+        batch_size: int = 500,
+    ) -> List[int]:
+        """Create all tasks in bulk import batches of batch_size instead of
+        one round-trip per task. Returns the new task ids (None per task if
+        the server does not report them)."""
+        for task in tasks:
+            task.make_url(img_server_root, img_server_url)
+        task_dicts = [task.as_dict() for task in tasks]
+        task_ids = []
+        for start in range(0, len(task_dicts), batch_size):
+            batch = task_dicts[start : start + batch_size]
+            try:
+                answer = self.connector.create_tasks_bulk(
+                    project=project_id, tasks=batch
+                )
+            except AssertionError:  # server without the bulk import endpoint
+                task_ids.extend(self.create_tasks_parallel(batch, project_id))
+            else:
+                task_ids.extend(answer.get("task_ids", [None] * len(batch)))
+        return task_ids
+
+    def create_tasks_parallel(
+        self, task_dicts: List[dict], project_id, max_workers: int = 16
+    ) -> List[int]:
+        """Per-task fallback that issues the POSTs concurrently. The work is
+        purely I/O-bound and the connector's Session is thread-safe for
+        independent requests, so threads overlap the round-trips."""
+
+        def post_one(task_dict):
+            answer = self.connector.create_task(data=task_dict, project=project_id)
+            return answer["id"]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(post_one, task_dicts))
+
     @staticmethod
     def _parse_image_filename(filename: str) -> Tuple[int, int, str, str]:
         # TODO: convert this script to maintainable classes and functions
@@ -100,18 +164,15 @@ class TaskDAO:
         Returns:
             Tuple[int, int, str, str]: task_id, annotation_id, by, label_str
         """
-        pattern = r"task-(?P<task>\d+)-annotation-(?P<annotation>\d+)-by-(?P<email>[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+)-labels-(?P<label>[\sa-zA-Z0-9_.+-]+)-[0-9+].png"
-        result = re.search(pattern, filename)
+        result = _FILENAME_RE.search(filename)
         if result is None:
             raise ValueError(f"Invalid filename: {filename}")
-        result = (
+        return (
             int(result.group("task")),
             int(result.group("annotation")),
             result.group("email"),
             result.group("label"),
         )
-        result
-        return result
 
     def get_task_annotations(
         self, project_id: int, task_id: int, study_path: int
@@ -154,105 +215,121 @@ class TaskDAO:
             task_ids=[task_id],
             local_folder=study_path,
         )
-        temp_folder = os.path.join(study_path, "temp")
-        try:
-            if task_file.endswith(".zip"):  # more than one label
-                create_dir_if_missing(temp_folder)
-                with zipfile.ZipFile(task_file, "r") as zip_file:
-                    zip_file.extractall(temp_folder)
-                os.remove(task_file)
-                all_images = list_files(temp_folder, ".png")
-            elif task_file.endswith(".png"):  # a single label
-                _, filename = os.path.split(task_file)
-                img_path = os.path.join(temp_folder, filename)
-                os.rename(task_file, img_path)
-                all_images = [img_path]
-            else:
-                raise TypeError(f"Unkown extension of file: {task_file}")
-            all_images
-            # Run quality checks
-            ## No annotations in the edge.
-            ## Empty Pixels that are fully surrounded by annotatated pixels.
-            ## Annotations in black areas.
-            # Merge labels that have the same annotation and title
-            annotations = {
-                annotation_dict["annotation_id"]: {  # as obtained from LS
-                    "task_id": annotation_dict["id"],
-                    "anntoation_id": annotation_dict["annotation_id"],
-                    "crop_details": annotation_dict["crop_details"],
-                    "study_path": study_path,
-                    "labels": {
-                        label_dict["brushlabels"][0]: []
-                        for label_dict in annotation_dict["labels"]
-                    },
-                }
-                for annotation_dict in task_json
+        # keep the exported pngs in memory as (filename, bytes) pairs; only
+        # the final merged/recovered masks ever touch the disk
+        if task_file.endswith(".zip"):  # more than one label
+            with zipfile.ZipFile(task_file, "r") as zip_file:
+                all_images = [
+                    (os.path.basename(name), zip_file.read(name))
+                    for name in zip_file.namelist()
+                    if name.endswith(".png")
+                ]
+        elif task_file.endswith(".png"):  # a single label
+            _, filename = os.path.split(task_file)
+            with open(task_file, "rb") as file:
+                all_images = [(filename, file.read())]
+        else:
+            raise TypeError(f"Unkown extension of file: {task_file}")
+        os.remove(task_file)
+        # Run quality checks
+        ## No annotations in the edge.
+        ## Empty Pixels that are fully surrounded by annotatated pixels.
+        ## Annotations in black areas.
+        # Merge labels that have the same annotation and title
+        annotations = {
+            annotation_dict["annotation_id"]: {  # as obtained from LS
+                "task_id": annotation_dict["id"],
+                "anntoation_id": annotation_dict["annotation_id"],
+                "crop_details": annotation_dict["crop_details"],
+                "study_path": study_path,
+                "labels": {
+                    label_dict["brushlabels"][0]: []
+                    for label_dict in annotation_dict["labels"]
+                },
             }
-            ## Group images by annotation-label
-            for image in all_images:
-                temp_folder, filename = os.path.split(image)
-                task_id, ann_id, by, label = self._parse_image_filename(filename)
-                annotations[ann_id]["labels"][label].append(image)
-
-            annotations_folder = os.path.join(study_path, "annotations")
-            create_dir_if_missing(annotations_folder)
-
-            ## Merge and save in the correct location
-            for a_id, annotation in annotations.items():
-                annotation_folder = os.path.join(annotations_folder, str(a_id))
-                create_dir_if_missing(annotation_folder)
-                annot_all_views_folder = os.path.join(annotation_folder, "all_views")
-                create_dir_if_missing(annot_all_views_folder)
-                for label, images in annotation["labels"].items():
-                    l = len(images)
-                    safe_label = label.replace(" ", "_")
-                    new_name = f"p-{project_id}-t-{task_id}-a-{a_id}-all_views-{safe_label}.png"
-                    new_filepath = os.path.join(annot_all_views_folder, new_name)
-                    if l == 1:  # Rename and move file to folder
-                        os.rename(images[0], new_filepath)
-                    elif l > 1:
-                        merge_images(images, new_filepath)
-                    else:
-                        raise IndexError(
-                            f"Found {l} images in annotation{a_id} - label {label}"
-                        )
-                    with Image.open(new_filepath) as im:
+            for annotation_dict in task_json
+        }
+        ## Group image buffers by annotation-label
+        for filename, buffer in all_images:
+            task_id, ann_id, by, label = self._parse_image_filename(filename)
+            annotations[ann_id]["labels"][label].append(buffer)
+
+        annotations_folder = os.path.join(study_path, "annotations")
+
+        ## Merge and save in the correct location
+        for a_id, annotation in annotations.items():
+            annotation_folder = os.path.join(annotations_folder, str(a_id))
+            annot_all_views_folder = os.path.join(annotation_folder, "all_views")
+            # one call covers the whole chain of parents
+            os.makedirs(annot_all_views_folder, exist_ok=True)
+            for label, buffers in annotation["labels"].items():
+                l = len(buffers)
+                safe_label = label.replace(" ", "_")
+                new_name = (
+                    f"p-{project_id}-t-{task_id}-a-{a_id}-all_views-{safe_label}.png"
+                )
+                new_filepath = os.path.join(annot_all_views_folder, new_name)
+                if l == 1:  # already a complete mask, write the bytes as-is
+                    with open(new_filepath, "wb") as file:
+                        file.write(buffers[0])
+                    with Image.open(BytesIO(buffers[0])) as im:
                         im_array = np.array(im)
-                        output_list.append(
-                            dict(
-                                project_id=project_id,
-                                task_id=task_id,
-                                annotation_id=a_id,
-                                view="all_views",
-                                label=safe_label,
-                                annotated_pixels=np.count_nonzero(im_array),
-                                image_path=new_filepath,
-                            )
-                        )
-                        # Recover original shape by reversing the crop
-                        recovered = reverse_crop(im_array, annotation["crop_details"])
-                    for lat_view, (im, pixel_count) in recovered.items():
-                        lat_view_folder = os.path.join(annotation_folder, lat_view)
-                        create_dir_if_missing(lat_view_folder)
-                        image_name = f"p-{project_id}-t-{task_id}-a-{a_id}-{lat_view}-{safe_label}.png"
-                        image_path = os.path.join(lat_view_folder, image_name)
-                        im.save(image_path)
-                        output_list.append(
-                            dict(
-                                project_id=project_id,
-                                task_id=task_id,
-                                annotation_id=a_id,
-                                view=lat_view,
-                                label=safe_label,
-                                annotated_pixels=pixel_count,
-                                image_path=image_path,
-                            )
+                elif l > 1:
+                    # merge_images hands back the array it just saved
+                    im_array = merge_images(buffers, new_filepath)
+                else:
+                    raise IndexError(
+                        f"Found {l} images in annotation{a_id} - label {label}"
+                    )
+                # Recover original shape by reversing the crop. The per-view
+                # counts it returns sum to the all_views count, so the mosaic
+                # never needs its own full-array scan.
+                recovered = reverse_crop(im_array, annotation["crop_details"])
+                output_list.append(
+                    dict(
+                        project_id=project_id,
+                        task_id=task_id,
+                        annotation_id=a_id,
+                        view="all_views",
+                        label=safe_label,
+                        annotated_pixels=sum(
+                            pixel_count for _, pixel_count in recovered.values()
+                        ),
+                        image_path=new_filepath,
+                    )
+                )
+                for lat_view, (im, pixel_count) in recovered.items():
+                    lat_view_folder = os.path.join(annotation_folder, lat_view)
+                    create_dir_if_missing(lat_view_folder)
+                    image_name = f"p-{project_id}-t-{task_id}-a-{a_id}-{lat_view}-{safe_label}.png"
+                    image_path = os.path.join(lat_view_folder, image_name)
+                    im.save(
+                        image_path, format="PNG", optimize=False, compress_level=1
+                    )
+                    output_list.append(
+                        dict(
+                            project_id=project_id,
+                            task_id=task_id,
+                            annotation_id=a_id,
+                            view=lat_view,
+                            label=safe_label,
+                            annotated_pixels=pixel_count,
+                            image_path=image_path,
                         )
-        finally:
-            rmtree(temp_folder)
+                    )
         return output_list
 
 
+def _export_task_annotations(job):
+    """Worker for ProjectDAO.export_tasks_from_csv. Builds its own connector
+    because live sessions are not picklable across processes."""
+    ls_url, token, project_id, task_id, study_path = job
+    task_dao = TaskDAO(LabelStudioAPI(ls_url, token))
+    return task_dao.get_task_annotations(
+        project_id=project_id, task_id=task_id, study_path=study_path
+    )
+
+
 class ProjectDAO:
     def __init__(self, connector: LabelStudioAPI):
         self.connector = connector
@@ -265,12 +342,9 @@ class ProjectDAO:
         instruction_path: str,
     ):
 
-        # read the labeling interface config
-        with open(interface_config_path) as file:
-            config = "".join([l for l in file])
-        # read the labeling interface config
-        with open(instruction_path) as file:
-            instructions = "".join([l for l in file])
+        # read the labeling interface config and instructions (cached)
+        config = _read_text(interface_config_path)
+        instructions = _read_text(instruction_path)
 
         project = self.connector.create_project(
             title=title,
@@ -291,6 +365,7 @@ class ProjectDAO:
         instruction_path: str,
         root_path: str,
         img_server_url: str,
+        batch_size: int = 500,
     ):
         """Create a Label Studio project and create tasks based on a CSV file.
 
@@ -302,36 +377,42 @@ class ProjectDAO:
             root_path (str): Path where the patients' folders exist. This is
              also the root of the img server
             img_server_url (str): base url where the images will be found
+            batch_size (int, optional): tasks per bulk import request.
+             Defaults to 500.
         """
-        csv.field_size_limit(sys.maxsize)
         csv_parent, csv_basename = os.path.split(csv_path)
         today = datetime.now().strftime("%Y-%m-%d")
         title = f"MRI {today}"
         description = f"Based on {csv_basename}"
-        task_dicts = []
-        # preventive read first
-        with open(csv_path, newline="") as file:
+        tasks = []
+        rows = []
+        # single streaming pass: validate and build each task as it is read,
+        # with the image work fanned out over a process pool
+        with open(csv_path, newline="") as file, ProcessPoolExecutor() as executor:
             reader = DictReader(file)
             fields = reader.fieldnames
             assert "anonPatientId" in fields
             assert "anonExaminationStudyId" in fields
             assert "ReportTextText" in fields
-            for row in reader:
+            # create project
+            print(f"Creating {title} {description}")
+            project_id = self.create_project(
+                title, description, interface_config_path, instruction_path
+            )
+            print(f"Successfullly created project {project_id}")
+            futures = [
+                (row, executor.submit(MRITask.from_csv_row, root_path, row))
+                for row in reader
+            ]
+            for row, future in tqdm(futures, desc="Preparing tasks"):
                 try:
-                    assert os.path.exists(
-                        os.path.join(
-                            root_path, row["anonPatientId"], row["anonExaminationStudyId"]
-                        )
-                    ), f"{row['anonPatientId']}/{row['anonExaminationStudyId']} does not exist"
-                    task_dicts.append(row)
-                except:
-                    print(f"{row['anonPatientId']}/{row['anonExaminationStudyId']} does not exist")
-        # create project
-        print(f"Creating {title} {description}")
-        project_id = self.create_project(
-            title, description, interface_config_path, instruction_path
-        )
-        print(f"Successfullly created project {project_id}")
+                    # from_csv_row asserts that the study folder exists
+                    task = future.result()
+                    tasks.append(task)
+                    rows.append(row)
+                except Exception as e:
+                    print(e)
+                    print(f"Failed to prepare task for {row['anonPatientId']}/{row['anonExaminationStudyId']}")
         # now send all tasks to labelstudio
         task_dao = TaskDAO(self.connector)
         new_csv_path = os.path.join(csv_parent, f"{project_id}-MRI-{today}.csv")
@@ -343,17 +424,22 @@ class ProjectDAO:
             "left_axial",
             "right_axial",
         ]
-        with open(new_csv_path, "w") as file:
+        # bulk import in batches instead of one POST per task, flushing the
+        # csv after each batch so an aborted run keeps the uploaded ids
+        with open(new_csv_path, "w", newline="") as file:
             writer = DictWriter(file, out_fieldnames)
             writer.writeheader()
-            pbar = tqdm(total = len(task_dicts), desc = "Creating tasks")
-            for task_dict in task_dicts:
-                try:
-                    task = MRITask.from_csv_row(root_path, task_dict)
-                    task_id = task_dao.create_task(
-                        task, project_id, img_server_url, root_path
-                    )
-                    print(task_id)
+            for start in range(0, len(tasks), batch_size):
+                batch_tasks = tasks[start : start + batch_size]
+                batch_rows = rows[start : start + batch_size]
+                task_ids = task_dao.create_tasks(
+                    batch_tasks,
+                    project_id,
+                    img_server_url,
+                    root_path,
+                    batch_size=batch_size,
+                )
+                for task_dict, task, task_id in zip(batch_rows, batch_tasks, task_ids):
                     # Add information to output dict
                     task_dict["ls_project_id"] = project_id
                     task_dict["ls_task_id"] = task_id
@@ -364,22 +450,33 @@ class ProjectDAO:
                         "right_sagittal", None
                     )
                     task_dict["left_axial"] = task.crop_details.get("left_axial", None)
-                    task_dict["right_axial"] = task.crop_details.get("right_axial", None)
-                    writer.writerow(task_dict)
-                    pbar.update()
-                except Exception as e:
-                    print(e)
-                    print(f"Failed to create task for {task_dict['anonPatientId']}/{task_dict['anonExaminationStudyId']}")
+                    task_dict["right_axial"] = task.crop_details.get(
+                        "right_axial", None
+                    )
+                writer.writerows(batch_rows)
+                file.flush()
+
     def export_tasks_from_csv(self, tasks_csv_path: str, images_csv_path: str):
         root_path, csv_name = os.path.split(tasks_csv_path)
-        task_dao = TaskDAO(self.connector)
         with open(tasks_csv_path) as input_csv:
-            total_tasks = sum(1 for _ in DictReader(input_csv))
-
-        with open(tasks_csv_path) as input_csv, open(
-            images_csv_path, "w"
-        ) as output_csv:
+            jobs = [
+                (
+                    self.connector.url,
+                    self.connector.token,
+                    row["ls_project_id"],
+                    row["ls_task_id"],
+                    os.path.join(
+                        root_path, row["anonPatientId"], row["anonExaminationStudyId"]
+                    ),
+                )
+                for row in DictReader(input_csv)
+            ]
 
+        # each task export is an independent download + decode + reverse_crop;
+        # fan them out over processes and keep the csv writer in this one
+        with open(images_csv_path, "w", newline="") as output_csv, (
+            ProcessPoolExecutor()
+        ) as executor:
             writer = DictWriter(
                 output_csv,
                 fieldnames=[
@@ -392,17 +489,10 @@ class ProjectDAO:
                     "image_path",
                 ],
             )
-            reader = DictReader(input_csv)
             writer.writeheader()
-            for row in tqdm(
-                reader, desc=f"Exporting tasks from {csv_name}", total=total_tasks
+            for image_rows in tqdm(
+                executor.map(_export_task_annotations, jobs, chunksize=4),
+                desc=f"Exporting tasks from {csv_name}",
+                total=len(jobs),
             ):
-                project_id = row["ls_project_id"]
-                task_id = row["ls_task_id"]
-                patient_id = row["anonPatientId"]
-                study_id = row["anonExaminationStudyId"]
-                study_folder = os.path.join(root_path, patient_id, study_id)
-                image_rows = task_dao.get_task_annotations(
-                    project_id=project_id, task_id=task_id, study_path=study_folder
-                )
                 writer.writerows(image_rows)